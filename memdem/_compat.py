@@ -0,0 +1,18 @@
+"""Module for compatibility with older Python versions."""
+try:
+    from functools import cached_property
+except ImportError:  # Python < 3.8
+
+    class cached_property:  # type: ignore
+        """Minimal stand-in for functools.cached_property."""
+
+        def __init__(self, func):
+            self.func = func
+            self.__doc__ = func.__doc__
+
+        def __get__(self, instance, owner=None):
+            """Compute the value once and store it on the instance."""
+            if instance is None:
+                return self
+            value = instance.__dict__[self.func.__name__] = self.func(instance)
+            return value
@@ -1,4 +1,6 @@
 """Module for defining some constants."""
-SERVICE_S3_URL = "s3://elevation-tiles-prod/geotiff/{z}/{x}/{y}.tif"
+SERVICE_S3_ROOT = "s3://elevation-tiles-prod/geotiff"
+SERVICE_VSI_ROOT = "/vsis3/elevation-tiles-prod/geotiff"
+SERVICE_S3_URL = SERVICE_S3_ROOT + "/{z}/{x}/{y}.tif"
 ELEVATION_TILE_SIZE = 512
 ELEVATION_BLOCK_SIZE = 256
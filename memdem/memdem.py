@@ -1,16 +1,64 @@
 """Module for generating DEM."""
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import contextmanager
 from functools import wraps
-from os import PathLike
+from itertools import repeat
+from os import PathLike, fspath
 from typing import Iterator, Optional, Sequence, Tuple, Union
 
 import morecantile
+import numpy as np
 import rasterio
 import rasterio.shutil
+from affine import Affine
 
-from memdem.constants import ELEVATION_TILE_SIZE, SERVICE_S3_URL
+from memdem._compat import cached_property
+from memdem.constants import ELEVATION_TILE_SIZE, SERVICE_S3_ROOT, SERVICE_VSI_ROOT
 from memdem.tms import default_tms
-from memdem.vrt import buildvrt
+from memdem.vrt import buildvrt, iterbuildvrt
+
+_WGS84 = rasterio.crs.CRS.from_epsg(4326)
+
+_PREFETCH_MAX_CACHE_SIZE = 256 * 2**20
+
+
+def _prefetch_options(ntiles: int) -> dict:
+    """GDAL config options for reading many tiles concurrently."""
+    return dict(
+        GDAL_HTTP_MULTIPLEX=True,
+        VSI_CACHE=True,
+        # the /vsicurl/ block cache is shared by the whole process and only
+        # sized when first used, so this only has an effect if no /vsicurl/
+        # access happened before. Aim for the first chunks of every tile, but
+        # stay between GDAL's 16 MB default and _PREFETCH_MAX_CACHE_SIZE.
+        CPL_VSIL_CURL_CACHE_SIZE=min(
+            max(16 * 2**20, ntiles * 2**16), _PREFETCH_MAX_CACHE_SIZE
+        ),
+    )
+
+
+def _prefetch_tile(url: str, options: dict):
+    # rasterio environments are thread local, so the options are entered again
+    # in the worker thread. Plain GDAL config options keep this cheap compared
+    # to aws_unsigned=True, which sets up an AWS session every time.
+    with rasterio.Env(**options):
+        try:
+            with rasterio.open(url):
+                pass
+        except rasterio.errors.RasterioIOError:
+            # best effort, the error surfaces again when the tile is read
+            pass
+
+
+def _prefetch(urls: Sequence[str], max_workers: int, options: dict):
+    """Open tiles concurrently to warm GDAL's /vsis3/ caches."""
+    # VSI_CACHE is a per handle cache, and prefetched tiles are closed right away
+    options = {k: v for k, v in options.items() if k != "VSI_CACHE"}
+    options["AWS_NO_SIGN_REQUEST"] = "YES"
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        # consume the results so that unexpected errors are raised here
+        for _ in executor.map(_prefetch_tile, urls, repeat(options)):
+            pass
 
 
 class DEMTiles:
@@ -64,123 +112,152 @@ class DEMTiles:
         tileset = self.tms.tiles(*bounds, zooms=self.zoom)
         self.tileset, self.nx, self.ny = self._extract_tileset(tileset)
 
-        self._width = self._get_width()
-        self._height = self._get_height()
-        self._shape = self._get_shape()
-        self._offsets = self._get_offsets()
-        self._transform = self._get_transform()
-        self._bounds = self._get_bounds()
-
-    @property
+    @cached_property
     def width(self):
         """Return the width of the DEM in pixels."""
-        return self._width
-
-    def _get_width(self):
         return self.nx * ELEVATION_TILE_SIZE
 
-    @property
+    @cached_property
     def height(self):
         """Return the height of the DEM in pixels."""
-        return self._height
-
-    def _get_height(self):
         return self.ny * ELEVATION_TILE_SIZE
 
-    @property
+    @cached_property
     def shape(self):
         """Return the (height, width) of the DEM in pixels."""
-        return self._shape
-
-    def _get_shape(self):
         return (self.height, self.width)
 
-    @property
+    @cached_property
     def offsets(self):
         """Return a sequence of (xoffset, yoffset, xsize, ysize) corresponding to each Tile in tileset. Used to mosaic individual tiles into a single DEM."""
-        return self._offsets
-
-    def _get_offsets(self):
-        offsets = []
-        first_tile = next(iter(self.tileset))
-        startx = first_tile.x
-        starty = first_tile.y
-        for tile in self.tileset:
-            dst_idxx = tile.x - startx
-            dst_idxy = tile.y - starty
-            offsets.append(
-                (
-                    ELEVATION_TILE_SIZE * dst_idxx,
-                    ELEVATION_TILE_SIZE * dst_idxy,
-                    ELEVATION_TILE_SIZE,
-                    ELEVATION_TILE_SIZE,
-                )
-            )
-        return offsets
-
-    @property
+        dx = (self._xs - self._min_x) * ELEVATION_TILE_SIZE
+        dy = (self._ys - self._min_y) * ELEVATION_TILE_SIZE
+        size = np.full_like(dx, ELEVATION_TILE_SIZE)
+        offsets = np.stack([dx, dy, size, size], axis=1)
+        return list(map(tuple, offsets.tolist()))
+
+    @cached_property
     def bounds(self):
         """Return bounds of tileset in tile crs."""
-        return self._bounds
-
-    def _get_bounds(self):
-        left, bottom, right, top = (0, self.height, self.width, 0)
-        left, bottom = self.transform * (left, bottom)
-        right, top = self.transform * (right, top)
+        # north-up transform, so the corners follow from origin and pixel size
+        a, _, c, _, e, f = self.transform[:6]
         return rasterio.coords.BoundingBox(
-            left=left, bottom=bottom, right=right, top=top
+            left=c, bottom=f + self.height * e, right=c + self.width * a, top=f
         )
 
-    @property
+    @cached_property
+    def _matrix(self):
+        # TileMatrixSet.matrix is a linear search over the zoom levels
+        return self.tms.matrix(self.zoom)
+
+    @cached_property
     def transform(self):
         """Return geotransform for tileset in tile crs."""
-        return self._transform
-
-    def _get_transform(self):
-        matrix = self.tms.matrix(self.zoom)
-        pixel_size = self.tms._resolution(matrix)
+        pixel_size = self.tms._resolution(self._matrix)
 
-        ul_tile = min(self.tileset)
-        coords = self.tms.ul(ul_tile)
+        coords = self.tms.ul(self._ul_tile)
         coords_xy = self.tms.xy(*coords)
-        return rasterio.transform.from_origin(*coords_xy, pixel_size, pixel_size)
+        return Affine(pixel_size, 0.0, coords_xy[0], 0.0, -pixel_size, coords_xy[1])
 
     def _extract_tileset(
         self, tiles: Iterator[morecantile.Tile]
     ) -> Tuple[Sequence[morecantile.Tile], int, int]:
-        tileset = []
-        x = []
-        y = []
-        for tile in tiles:
-            tileset.append(tile)
-            x.append(tile.x)
-            y.append(tile.y)
+        tileset = list(tiles)
+        self._xs = np.fromiter(
+            (t.x for t in tileset), dtype=np.int32, count=len(tileset)
+        )
+        self._ys = np.fromiter(
+            (t.y for t in tileset), dtype=np.int32, count=len(tileset)
+        )
 
-        nx = len(set(x))
-        ny = len(set(y))
+        # tiles form a dense rectangle over the TMS grid, so its extent in tile
+        # coordinates is enough to count tiles along each axis
+        min_x, max_x = int(self._xs.min()), int(self._xs.max())
+        min_y, max_y = int(self._ys.min()), int(self._ys.max())
+        self._min_x = min_x
+        self._min_y = min_y
+        self._ul_tile = morecantile.Tile(min_x, min_y, tileset[0].z)
 
-        return (tileset, nx, ny)
+        return (tileset, max_x - min_x + 1, max_y - min_y + 1)
 
     def get_tile_urls(self) -> Sequence[str]:
         """Build s3 urls from tileset."""
-        return [SERVICE_S3_URL.format(z=t.z, x=t.x, y=t.y) for t in self.tileset]
+        return self._get_tile_urls(SERVICE_S3_ROOT)
+
+    def get_tile_vsi_urls(self) -> Sequence[str]:
+        """Build GDAL /vsis3/ paths from tileset."""
+        return self._get_tile_urls(SERVICE_VSI_ROOT)
+
+    def _get_tile_urls(self, root: str) -> Sequence[str]:
+        # same layout as SERVICE_S3_URL, with the zoom level formatted only once
+        prefix = f"{root}/{self.zoom}/"
+        return [f"{prefix}{t.x}/{t.y}.tif" for t in self.tileset]
 
     def to_string(self):
         """Generate VRT string."""
-        urls = self.get_tile_urls()
+        urls = self.get_tile_vsi_urls()
         return buildvrt(urls, self.shape, self.offsets, self.transform, self.tms.crs)
 
-    def to_file(self, fname: Union[str, PathLike]):
-        """Write VRT to file."""
-        rasterio.shutil.copy(self.to_string(), fname, driver="VRT")
+    def to_file(self, fname: Union[str, PathLike], driver: str = "VRT", **kwargs):
+        """Write VRT to file.
+
+        Parameters
+        ----------
+        fname : str or PathLike
+            Destination path. Local paths are written to directly, GDAL virtual
+            file system paths (e.g. /vsimem/) and URLs are written through GDAL.
+        driver : str, optional
+            GDAL driver of the output. Defaults to "VRT". Any other driver
+            translates the DEM with rasterio.shutil.copy, which reads every tile.
+        kwargs : optional
+            Creation options passed to rasterio.shutil.copy. Only supported for
+            non-VRT drivers.
+        """
+        if driver == "VRT" and kwargs:
+            raise ValueError("Creation options are not supported for VRT output")
+
+        path = fspath(fname)
+        if driver != "VRT":
+            # translating reads every tile from the public bucket
+            with rasterio.Env(aws_unsigned=True):
+                rasterio.shutil.copy(self.to_string(), path, driver=driver, **kwargs)
+            return
+
+        if path.startswith("/vsi") or "://" in path:
+            # sources aren't opened, keep the caller's credentials for writing
+            rasterio.shutil.copy(self.to_string(), path, driver="VRT")
+            return
+
+        chunks = iterbuildvrt(
+            self.get_tile_vsi_urls(),
+            self.shape,
+            self.offsets,
+            self.transform,
+            self.tms.crs,
+        )
+        with open(path, "w", encoding="utf-8") as f:
+            f.writelines(chunks)
 
     @contextmanager
-    def open(self):
-        """Yield rasterio dataset of DEM VRT."""
-        with rasterio.Env(aws_unsigned=True):
+    def open(self, prefetch: bool = False, max_workers: int = 16):
+        """Yield rasterio dataset of DEM VRT.
+
+        Parameters
+        ----------
+        prefetch : bool, optional
+            Open every tile concurrently before yielding the dataset. This warms
+            GDAL's /vsis3/ caches so that subsequent reads don't pay for a
+            metadata round trip per tile. Defaults to False.
+        max_workers : int, optional
+            Number of threads used to prefetch tiles. Defaults to 16.
+        """
+        options = _prefetch_options(len(self.tileset)) if prefetch else {}
+        with rasterio.Env(aws_unsigned=True, **options):
             with rasterio.MemoryFile(ext=".vrt") as mem:
                 rasterio.shutil.copy(self.to_string(), mem.name, driver="VRT")
                 with mem.open() as dem:
+                    if prefetch:
+                        _prefetch(self.get_tile_vsi_urls(), max_workers, options)
                     yield dem
 
     @classmethod
@@ -212,8 +289,7 @@ class DEMTiles:
 
         # ensure bounds in geographic (lon, lat) coordinates
         bounds = dataset.bounds
-        bounds = rasterio.warp.transform_bounds(
-            dataset.crs, rasterio.crs.CRS.from_epsg(4326), *bounds
-        )
+        if dataset.crs != _WGS84:
+            bounds = rasterio.warp.transform_bounds(dataset.crs, _WGS84, *bounds)
 
         return cls(bounds, zoom=zoom, pixel_size=pixel_size)
@@ -1,6 +1,8 @@
 """Module for VRT creation."""
-from typing import Any, Iterable, Sequence, Tuple
-from xml.etree import ElementTree as ET
+import re
+from functools import lru_cache
+from typing import Any, Dict, Iterable, Iterator, Optional, Sequence, Tuple
+from xml.sax.saxutils import escape
 
 import morecantile
 import rasterio
@@ -8,6 +10,65 @@ from affine import Affine
 
 from memdem.constants import ELEVATION_TILE_SIZE, ELEVATION_BLOCK_SIZE
 
+# VRT document fragments. Only the per-dataset and per-tile fields are left as
+# placeholders. Tiles never overlap, so sources don't need per-source nodata
+# handling and can use the cheaper SimpleSource; nodata is set on the band.
+# Source elements leave out anything GDAL defaults to (relativeToVRT="0",
+# SourceBand 1) to keep the per-tile part of the document small.
+_HEADER_TEMPLATE = (
+    '<VRTDataset rasterXSize="{width}" rasterYSize="{height}">'
+    '<SRS dataAxisToSRSAxisMapping="{axis_mapping}">{wkt}</SRS>'
+    "<GeoTransform>{transform}</GeoTransform>"
+    '<VRTRasterBand dataType="{dtype}" band="1">'
+    "<NoDataValue>{nodata}</NoDataValue>"
+    "<ColorInterp>Gray</ColorInterp>"
+)
+_SOURCE_TEMPLATE = (
+    "<SimpleSource>"
+    "<SourceFilename>{uri}</SourceFilename>"
+    f'<SourceProperties RasterXSize="{ELEVATION_TILE_SIZE}" '
+    f'RasterYSize="{ELEVATION_TILE_SIZE}" DataType="Int16" '
+    f'BlockXSize="{ELEVATION_BLOCK_SIZE}" BlockYSize="{ELEVATION_BLOCK_SIZE}" />'
+    f'<SrcRect xOff="0" yOff="0" xSize="{ELEVATION_TILE_SIZE}" '
+    f'ySize="{ELEVATION_TILE_SIZE}" />'
+    '<DstRect xOff="{xoff}" yOff="{yoff}" xSize="{xsize}" ySize="{ysize}" />'
+    "</SimpleSource>"
+)
+_FOOTER = "</VRTRasterBand></VRTDataset>"
+
+# dataAxisToSRSAxisMapping of the crs commonly used with Elevation Tiles, to
+# avoid querying PROJ for them
+_AXIS_MAP: Dict[Optional[int], str] = {3857: "1,2", 4326: "2,1"}
+
+# authority of the outermost WKT node, which closes the document
+_WKT_EPSG_AUTHORITY = re.compile(r'(?:AUTHORITY|ID)\["EPSG",\s*"?(\d+)"?\]\]$')
+
+
+@lru_cache(maxsize=32)
+def _wkt_epsg(wkt: str) -> Optional[int]:
+    """Return the EPSG code a crs is defined with, from the authority of its WKT."""
+    # unlike crs.to_epsg() this doesn't search the PROJ database for a crs that
+    # merely resembles the one given
+    match = _WKT_EPSG_AUTHORITY.search(wkt)
+    return int(match.group(1)) if match else None
+
+
+@lru_cache(maxsize=32)
+def _axis_mapping(wkt: str) -> str:
+    """Return the SRS dataAxisToSRSAxisMapping for a crs, keyed by its WKT."""
+    crs = rasterio.crs.CRS.from_wkt(wkt)
+    if rasterio.crs.epsg_treats_as_latlong(
+        crs
+    ) or rasterio.crs.epsg_treats_as_northingeasting(crs):
+        return "2,1"
+    return "1,2"
+
+
+@lru_cache(maxsize=32)
+def _gdal_typename(dtype: str) -> str:
+    """Return the GDAL name of a numpy datatype."""
+    return rasterio.dtypes._gdal_typename(dtype)
+
 
 def buildvrt(
     urls: Sequence[str],
@@ -25,8 +86,8 @@ def buildvrt(
     Parameters
     ----------
     urls : Sequence of str
-        Sequence of s3 urls pointing to valid Elevation Tiles, which collectively
-        represent a DEM.
+        Sequence of s3 urls or GDAL /vsis3/ paths pointing to valid Elevation
+        Tiles, which collectively represent a DEM. GDAL paths are used as is.
     shape : Two-tuple of int
         The pixel height and width of DEM.
     offsets : Sequence of Four-tuple
@@ -47,69 +108,59 @@ def buildvrt(
     str:
         An XML formatted string of a valid VRT dataset.
     """
+    return "".join(
+        iterbuildvrt(urls, shape, offsets, transform, crs, dtype=dtype, nodata=nodata)
+    )
+
+
+def iterbuildvrt(
+    urls: Sequence[str],
+    shape: Tuple[int, int],
+    offsets: Sequence[Tuple[int, int, int, int]],
+    transform: Affine,
+    crs: rasterio.crs.CRS = rasterio.crs.CRS.from_epsg(3857),
+    dtype: str = "int16",
+    nodata: Any = None,
+) -> Iterator[str]:
+    """
+    Incrementally create a VRT document of mosaic'd Elevation Tiles.
+
+    Takes the same parameters as buildvrt, but yields the document in chunks
+    (header, one chunk per tile, footer) so that it can be written out without
+    holding the whole document in memory.
+
+    Yields
+    ------
+    str:
+        Consecutive chunks of an XML formatted string of a valid VRT dataset.
+    """
     if nodata is None:
         nodata = min(rasterio.dtypes.dtype_ranges[dtype])
     height, width = shape
-    parsed_paths = [rasterio.parse_path(ds) for ds in urls]
-    vsi_paths = [p.as_vsi() for p in parsed_paths]
-
-    # root element
-    root = ET.Element("VRTDataset")
-    root.set("rasterXSize", str(width))
-    root.set("rasterYSize", str(height))
 
     # crs/SRS
     wkt = crs.to_wkt()
-    axis_mapping = "1,2"
-    if rasterio.crs.epsg_treats_as_latlong(
-        crs
-    ) or rasterio.crs.epsg_treats_as_northingeasting(crs):
-        axis_mapping = "2,1"
-    srs = ET.SubElement(root, "SRS")
-    srs.set("dataAxisToSRSAxisMapping", axis_mapping)
-    srs.text = wkt
+    axis_mapping = _AXIS_MAP.get(_wkt_epsg(wkt)) or _axis_mapping(wkt)
 
     # geotransform
     transform_str = ", ".join(
         list(map(lambda x: "{:.16e}".format(x), transform.to_gdal()))
     )
-    geotransform = ET.SubElement(root, "GeoTransform")
-    geotransform.text = transform_str
-
-    # bands
-    vrtrasterband = ET.SubElement(root, "VRTRasterBand")
-    vrtrasterband.set("dataType", rasterio.dtypes._gdal_typename(dtype))
-    vrtrasterband.set("band", "1")
-    vrtnodata = ET.SubElement(vrtrasterband, "NoDataValue")
-    vrtnodata.text = str(nodata)
-    vrtcolorinterp = ET.SubElement(vrtrasterband, "ColorInterp")
-    vrtcolorinterp.text = "Gray"
-
-    for offset, uri in zip(offsets, vsi_paths):
-        source = ET.SubElement(vrtrasterband, "ComplexSource")
-        sourcefilename = ET.SubElement(source, "SourceFilename")
-        sourcefilename.set("relativeToVRT", "0")
-        sourcefilename.text = uri
-        sourceband = ET.SubElement(source, "SourceBand")
-        sourceband.text = "1"
-        sourceproperties = ET.SubElement(source, "SourceProperties")
-        sourceproperties.set("RasterXSize", str(ELEVATION_TILE_SIZE))
-        sourceproperties.set("RasterYSize", str(ELEVATION_TILE_SIZE))
-        sourceproperties.set("DataType", "Int16")
-        sourceproperties.set("BlockXSize", str(ELEVATION_BLOCK_SIZE))
-        sourceproperties.set("BlockYSize", str(ELEVATION_BLOCK_SIZE))
-        srcrect = ET.SubElement(source, "SrcRect")
-        srcrect.set("xOff", "0")
-        srcrect.set("yoff", "0")
-        srcrect.set("xSize", str(ELEVATION_TILE_SIZE))
-        srcrect.set("ySize", str(ELEVATION_TILE_SIZE))
-        xoff, yoff, xsize, ysize = offset
-        dstrect = ET.SubElement(source, "DstRect")
-        dstrect.set("xOff", str(xoff))
-        dstrect.set("yOff", str(yoff))
-        dstrect.set("xSize", str(xsize))
-        dstrect.set("ySize", str(ysize))
-        srcnodata = ET.SubElement(source, "NODATA")
-        srcnodata.text = str(nodata)
-
-    return ET.tostring(root, "utf-8").decode("utf-8")
+
+    yield _HEADER_TEMPLATE.format(
+        width=width,
+        height=height,
+        axis_mapping=axis_mapping,
+        wkt=escape(wkt),
+        transform=transform_str,
+        dtype=_gdal_typename(dtype),
+        nodata=nodata,
+    )
+    format_source = _SOURCE_TEMPLATE.format
+    for (xoff, yoff, xsize, ysize), uri in zip(offsets, urls):
+        if not uri.startswith("/vsi"):
+            uri = rasterio.parse_path(uri).as_vsi()
+        yield format_source(
+            uri=escape(uri), xoff=xoff, yoff=yoff, xsize=xsize, ysize=ysize
+        )
+    yield _FOOTER
@@ -7,6 +7,7 @@ import rasterio
 from affine import Affine
 
 import memdem
+from memdem.constants import SERVICE_S3_ROOT, SERVICE_S3_URL, SERVICE_VSI_ROOT
 
 from .conftest import fake_mem_dataset
 
@@ -33,6 +34,21 @@ def test_dem():
     assert dem.offsets == [(0, 0, 512, 512)]
 
 
+def test_dem_multiple_tiles():
+    dem = memdem.DEMTiles((-123.6, 48.9, -122.7, 49.5), zoom=10)
+    assert dem.nx == 3
+    assert dem.ny == 4
+    assert len(dem.tileset) == dem.nx * dem.ny
+    assert dem.shape == (4 * 512, 3 * 512)
+    assert dem.offsets[0] == (0, 0, 512, 512)
+    assert dem.offsets[-1] == (1024, 1536, 512, 512)
+    ul_x, ul_y = dem.tms.xy(*dem.tms.ul(min(dem.tileset)))
+    assert (dem.transform.c, dem.transform.f) == pytest.approx((ul_x, ul_y))
+    left, bottom = dem.transform * (0, dem.height)
+    right, top = dem.transform * (dem.width, 0)
+    assert list(dem.bounds) == pytest.approx([left, bottom, right, top])
+
+
 @pytest.mark.parametrize(
     "pixel_size,expected",
     [(156543, 0), (4891.97, 4), (4891.0, 5), (305.75, 8), (4.777, 15)],
@@ -57,6 +73,23 @@ def test_dem_get_s3_urls():
     assert "s3://elevation-tiles-prod/geotiff/0/0/0.tif" == d.get_tile_urls()[0]
 
 
+def test_dem_get_vsi_urls():
+    d = memdem.DEMTiles((0, 0, 1, 1), zoom=0)
+    assert "/vsis3/elevation-tiles-prod/geotiff/0/0/0.tif" == d.get_tile_vsi_urls()[0]
+
+
+def test_dem_urls_match_template():
+    d = memdem.DEMTiles((-123.6, 48.9, -122.7, 49.5), zoom=10)
+    urls = [SERVICE_S3_URL.format(**t._asdict()) for t in d.tileset]
+    assert d.get_tile_urls() == urls
+    assert d.get_tile_vsi_urls() == [rasterio.parse_path(u).as_vsi() for u in urls]
+
+
+def test_service_vsi_root():
+    vsi_root = rasterio.parse_path(SERVICE_S3_ROOT).as_vsi()
+    assert vsi_root == SERVICE_VSI_ROOT
+
+
 def test_dem_from_dataset():
     mem, src = fake_mem_dataset()
     with mem:
@@ -70,6 +103,17 @@ def test_dem_from_dataset():
             assert tile.z == 8
 
 
+def test_dem_from_dataset_geographic():
+    src = mock.MagicMock()
+    src.crs = rasterio.crs.CRS.from_epsg(4326)
+    src.transform = Affine(0.1, 0.0, 0.0, 0.0, -0.1, 1.0)
+    src.bounds = rasterio.coords.BoundingBox(0.0, 0.0, 1.0, 1.0)
+    with mock.patch("rasterio.warp.transform_bounds") as transform_bounds:
+        d = memdem.DEMTiles.from_dataset(src, zoom=10)
+    transform_bounds.assert_not_called()
+    assert d.tileset == memdem.DEMTiles((0.0, 0.0, 1.0, 1.0), zoom=10).tileset
+
+
 def test_dem_from_dataset_no_geotransform():
     src = mock.MagicMock()
     src.transform = Affine.identity()
@@ -103,6 +147,46 @@ def test_dem_to_file(tmp_path):
             with out.open() as f:
                 s = f.read()
             assert s.startswith("<VRTDataset")
+            assert s == d.to_string()
+
+
+def test_dem_to_file_driver(tmp_path):
+    d = memdem.DEMTiles((0, 0, 1, 1), zoom=0)
+    out = tmp_path.joinpath("test.tif")
+    with mock.patch("rasterio.shutil.copy") as copy:
+        d.to_file(out, driver="GTiff", compress="deflate")
+    copy.assert_called_once_with(
+        d.to_string(), str(out), driver="GTiff", compress="deflate"
+    )
+
+
+def test_dem_to_file_vsimem():
+    d = memdem.DEMTiles((0, 0, 1, 1), zoom=0)
+    d.to_file("/vsimem/test.vrt")
+    with rasterio.open("/vsimem/test.vrt") as dem:
+        assert dem.shape == d.shape
+        assert dem.transform == d.transform
+    rasterio.shutil.delete("/vsimem/test.vrt")
+
+
+def test_dem_to_file_vsi_env():
+    d = memdem.DEMTiles((0, 0, 1, 1), zoom=0)
+    envs = []
+
+    def copy(*args, **kwargs):
+        envs.append(rasterio.env.hasenv())
+
+    with mock.patch("rasterio.shutil.copy", side_effect=copy):
+        d.to_file("/vsis3/my-bucket/dem.vrt")
+        d.to_file("/vsis3/my-bucket/dem.tif", driver="GTiff")
+    # only translating to another format reads tiles with an unsigned env
+    assert envs == [False, True]
+
+
+def test_dem_to_file_vrt_creation_options(tmp_path):
+    d = memdem.DEMTiles((0, 0, 1, 1), zoom=0)
+    with pytest.raises(ValueError):
+        d.to_file(tmp_path.joinpath("test.vrt"), compress="deflate")
 
 
 def test_dem_open():
@@ -116,3 +200,47 @@ def test_dem_open():
                 assert dem.shape == dem.shape
                 assert dem.crs == rasterio.crs.CRS.from_epsg(3857)
                 assert dem.transform == dem.transform
+
+
+def test_dem_open_prefetch():
+    d = memdem.DEMTiles((-123.6, 48.9, -122.7, 49.5), zoom=10)
+    with mock.patch("rasterio.open") as rio_open:
+        with d.open(prefetch=True, max_workers=4) as dem:
+            assert isinstance(dem, rasterio.DatasetReader)
+            assert rio_open.call_count == len(d.tileset)
+    opened = sorted(call.args[0] for call in rio_open.call_args_list)
+    assert opened == sorted(d.get_tile_vsi_urls())
+
+
+def test_dem_open_prefetch_errors():
+    d = memdem.DEMTiles((0, 0, 1, 1), zoom=0)
+    with mock.patch("rasterio.open", side_effect=rasterio.errors.RasterioIOError):
+        with d.open(prefetch=True) as dem:
+            assert isinstance(dem, rasterio.DatasetReader)
+    with mock.patch("rasterio.open", side_effect=RuntimeError):
+        with pytest.raises(RuntimeError):
+            with d.open(prefetch=True):
+                pass
+
+
+def test_dem_open_prefetch_env():
+    d = memdem.DEMTiles((0, 0, 1, 1), zoom=0)
+    envs = []
+
+    def rio_open(*args, **kwargs):
+        envs.append(rasterio.env.getenv())
+        return mock.MagicMock()
+
+    with mock.patch("rasterio.open", side_effect=rio_open):
+        with d.open(prefetch=True):
+            pass
+    assert len(envs) == 1
+    assert envs[0]["AWS_NO_SIGN_REQUEST"] == "YES"
+    assert "VSI_CACHE" not in envs[0]
+
+
+def test_prefetch_cache_size():
+    options = memdem.memdem._prefetch_options(1)
+    assert options["CPL_VSIL_CURL_CACHE_SIZE"] == 16 * 2**20
+    options = memdem.memdem._prefetch_options(10000)
+    assert options["CPL_VSIL_CURL_CACHE_SIZE"] == 256 * 2**20
@@ -1,3 +1,4 @@
+import numpy as np
 import rasterio
 from affine import Affine
 
@@ -29,3 +30,91 @@ def test_buildvrt_axis_swap_crs():
         urls, demtiles.shape, demtiles.offsets, demtiles.transform, crs
     )
     assert 'dataAxisToSRSAxisMapping="2,1"' in vrt
+
+
+def test_buildvrt_escapes_urls():
+    demtiles = memdem.DEMTiles((0, 0, 1, 1), zoom=0)
+    vrt = memdem.vrt.buildvrt(
+        ["/vsicurl/https://example.com/tile.tif?a=1&b=2"],
+        demtiles.shape,
+        demtiles.offsets,
+        demtiles.transform,
+        demtiles.tms.crs,
+    )
+    assert "tile.tif?a=1&amp;b=2</SourceFilename>" in vrt
+
+
+def test_buildvrt_non_epsg_crs():
+    crs = rasterio.crs.CRS.from_proj4("+proj=merc +lon_0=10 +datum=WGS84 +units=m")
+    assert crs.to_epsg() is None
+    demtiles = memdem.DEMTiles((0, 0, 1, 1), zoom=10)
+    vrt = memdem.vrt.buildvrt(
+        demtiles.get_tile_urls(),
+        demtiles.shape,
+        demtiles.offsets,
+        demtiles.transform,
+        crs,
+    )
+    with rasterio.open(vrt) as src:
+        assert src.crs == crs
+
+
+def test_buildvrt_mosaic_local_tiles(tmp_path):
+    profile = dict(
+        driver="GTiff",
+        width=512,
+        height=512,
+        count=1,
+        dtype="int16",
+        tiled=True,
+        blockxsize=256,
+        blockysize=256,
+    )
+    paths = []
+    for value in (1, 2):
+        path = str(tmp_path.joinpath(f"{value}.tif"))
+        with rasterio.open(path, "w", **profile) as dst:
+            dst.write(np.full((1, 512, 512), value, dtype="int16"))
+        paths.append(path)
+
+    vrt = memdem.vrt.buildvrt(
+        paths,
+        (512, 1024),
+        [(0, 0, 512, 512), (512, 0, 512, 512)],
+        Affine.identity(),
+    )
+    assert vrt.count("<SimpleSource>") == 2
+    assert '<SrcRect xOff="0" yOff="0" xSize="512" ySize="512" />' in vrt
+    with rasterio.open(vrt) as src:
+        data = src.read(1)
+    assert (data[:, :512] == 1).all()
+    assert (data[:, 512:] == 2).all()
+
+
+def test_axis_map_matches_crs():
+    for epsg, axis_mapping in memdem.vrt._AXIS_MAP.items():
+        wkt = rasterio.crs.CRS.from_epsg(epsg).to_wkt()
+        assert memdem.vrt._axis_mapping(wkt) == axis_mapping
+
+
+def test_buildvrt_approximate_epsg_crs():
+    # identifies as EPSG:26910 (NAD83 / UTM zone 10N), but has no datum
+    crs = rasterio.crs.CRS.from_proj4("+proj=utm +zone=10 +ellps=GRS80")
+    demtiles = memdem.DEMTiles((0, 0, 1, 1), zoom=10)
+    vrt = memdem.vrt.buildvrt(
+        demtiles.get_tile_urls(),
+        demtiles.shape,
+        demtiles.offsets,
+        demtiles.transform,
+        crs,
+    )
+    assert "NAD83" not in vrt
+    assert crs.to_wkt() in vrt
+
+
+def test_wkt_epsg():
+    for epsg in memdem.vrt._AXIS_MAP:
+        wkt = rasterio.crs.CRS.from_epsg(epsg).to_wkt()
+        assert memdem.vrt._wkt_epsg(wkt) == epsg
+    crs = rasterio.crs.CRS.from_proj4("+proj=utm +zone=10 +ellps=GRS80")
+    assert memdem.vrt._wkt_epsg(crs.to_wkt()) is None